@@ -1,43 +1,74 @@
 import asyncio
+import json
 import os
 import re
+import stat
+import tempfile
 
 import aiohttp.web as web
 
+from services.matcher import TopicMatcher
+
 
 class FileKeeper:
     """Object for easily retrieving api keys and topic dictionaries"""
-    def __init__(self):
-        self.base = 'data/'
+    def __init__(self, base='data/'):
+        self.base = base
         self.data = {}
+        self.responses = {}
         self.schemas = {}
+        self.matchers = {}
+        self.locks = {}
         self.load_files()
         self.set_schemas()
+        self.set_matchers()
+
+    @staticmethod
+    def parse(fn, lines):
+        """Parses lines of an api or topic dictionary file into its in-memory form"""
+        # if topic dictionary request
+        if any(sub in fn for sub in ['topics', 'subreddits']):
+            data = {}
+            for ln in lines:
+                topic, queries = ln.split(':')
+                data[topic] = queries.split(',')
+        # else api request
+        else:
+            data = [ln.split('|') for ln in lines]
+            # if single api key return only string of key, else return list
+            if len(data) == 1:
+                data = '"{}"'.format(data[0][0])
+        return data
 
     def load_files(self):
         """Loads required api and topic dictionary files into memory"""
-        files = os.listdir(self.base)
+        files = [fn for fn in os.listdir(self.base) if fn.endswith('.txt')]
         for fn in files:
             with open(os.path.join(self.base, fn)) as f:
                 lines = f.read().splitlines()
-            # if topic dictionary request
-            if any(sub in fn for sub in ['topics', 'subreddits']):
-                data = {}
-                for ln in lines:
-                    topic, queries = ln.split(':')
-                    data[topic] = queries.split(',')
-            # else api request
-            else:
-                data = [ln.split('|') for ln in lines]
-                # if single api key return only string of key, else return list
-                if len(data) == 1:
-                    data = '"{}"'.format(data[0][0])
-            self.data[fn.replace('.txt', '')] = data
+            self.set_data(fn.replace('.txt', ''), self.parse(fn, lines))
+
+    def set_data(self, source, data):
+        """Sets in-memory data of source along with its pre-encoded response"""
+        self.data[source] = data
+        self.responses[source] = str(data).encode()
+
+    def set_matchers(self):
+        """Builds reverse phrase index and multi-pattern matcher for each topic dictionary"""
+        for i in ['topics', 'subreddits']:
+            if i in self.data:
+                self.matchers[i] = TopicMatcher(self.data[i])
+
+    def classify(self, texts, source='topics'):
+        """Returns list of tickers matched in each of the provided texts using the source topic dictionary"""
+        return self.matchers[source].classify(texts)
 
     def set_schemas(self):
-        """Sets schemas for accepting new api keys"""
+        """Sets precompiled schemas for accepting new api keys, topic dictionaries do not accept keys"""
         for i in self.data:
-            self.schemas[i] = self.schema([8, 4, 4, 4, 12])
+            if i in ['topics', 'subreddits']:
+                continue
+            self.schemas[i] = re.compile(self.schema([8, 4, 4, 4, 12]))
 
     @staticmethod
     def schema(l):
@@ -49,35 +80,83 @@ class FileKeeper:
     def __getitem__(self, item):
         return self.data[item]
 
-    def update(self, key, source):
-        """Updates api keys with provided key from source"""
-        t = 'w' if source == 'twingly' else 'a'
-        search = re.compile(self.schemas[source])
-        if len(re.findall(search, key)) != 1:
+    def response(self, item):
+        """Returns pre-encoded response body for source"""
+        return self.responses[item]
+
+    def validate(self, key, source):
+        """Raises KeyError if key does not match the schema of source"""
+        if len(self.schemas[source].findall(key)) != 1:
             raise KeyError
-        else:
-            with open(os.path.join(self.base, source + '.txt'), t) as f:
-                f.write(key + '\n')
+
+    def write(self, key, source):
+        """Atomically writes key into source file, returns newly parsed data for source"""
+        fn = source + '.txt'
+        path = os.path.join(self.base, fn)
+        lines = []
+        if source != 'twingly' and os.path.exists(path):
+            with open(path) as f:
+                lines = f.read().splitlines()
+        lines.append(key)
+        # parse before touching the file so that a malformed update never reaches disk
+        data = self.parse(fn, lines)
+        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+        fd, tmp = tempfile.mkstemp(dir=self.base, prefix='.' + source, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, mode)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return data
+
+    async def update(self, key, source):
+        """Updates api keys with provided key from source, writes are serialized per source off the event loop"""
+        self.validate(key, source)
+        lock = self.locks.setdefault(source, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_event_loop()
+            data = await loop.run_in_executor(None, self.write, key, source)
+            self.set_data(source, data)
 
 
 class APIServer(web.Server):
     """Asynchronous api server for requesting api keys and topic dictionaries"""
-    def __init__(self):
-        super(APIServer, self).__init__(self.process_request)
-        self.files = FileKeeper()
+    # Classify batches of documents are far larger than aiohttp's default 1MiB request body limit
+    client_max_size = 64 * 1024 ** 2
+
+    def __init__(self, base='data/'):
+        super(APIServer, self).__init__(self.process_request, request_factory=self.make_request)
+        self.files = FileKeeper(base)
+
+    def make_request(self, message, payload, protocol, writer, task):
+        """Creates request allowing bodies of up to client_max_size bytes"""
+        return web.BaseRequest(message, payload, protocol, writer, task, asyncio.get_event_loop(),
+                               client_max_size=self.client_max_size)
 
     def on_data(self, params):
         source = params.get('q', None)
         if source is None:
             raise TypeError
         else:
-            return str(self.files[source])
+            return self.files.response(source)
 
-    def on_post(self, params, data):
+    def on_classify(self, params, texts):
+        source = params.get('index', 'topics')
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            raise TypeError
+        return json.dumps(self.files.classify(texts, source))
+
+    async def on_post(self, params, data):
         try:
             t = params['q']
             auth = data['auth']
-            self.files.update(auth, t)
+            await self.files.update(auth, t)
             return 'Success', 200
         except KeyError:
             return 'Failed!', 401
@@ -87,33 +166,32 @@ class APIServer(web.Server):
         try:
             if request.method == 'GET':
                 result = self.on_data(params)
-                return web.Response(text=result, status=200)
+                return web.Response(body=result, status=200, content_type='text/plain', charset='utf-8')
+            elif request.method == 'POST' and params.get('q', None) == 'classify':
+                texts = await request.json()
+                result = self.on_classify(params, texts)
+                return web.Response(text=result, status=200, content_type='application/json')
             elif request.method == 'POST':
                 data = await request.post()
-                result, code = self.on_post(params, data)
+                result, code = await self.on_post(params, data)
                 return web.Response(text=result, status=code)
-        except (KeyError, TypeError):
+        except (KeyError, TypeError, ValueError):
             return web.Response(text='Incorrect request', status=404)
 
+    async def stop(self):
+        """Drains api server - waits for any in-flight api key writes to finish"""
+        for lock in list(self.files.locks.values()):
+            async with lock:
+                pass
+
     @staticmethod
     async def run(api_address):
-        """Main server running function - creates and runs proxy server asynchronously"""
-        server = APIServer()
-        loop = asyncio.get_event_loop()
-        await loop.create_server(server, *api_address)
-
-        while True:
-            try:
-                await asyncio.sleep(60)
-            except KeyboardInterrupt:
-                break
-
-        await server.shutdown()
-        loop.close()
+        """Main server running function - creates and runs api server asynchronously until stopped"""
+        from services.launcher import load_config, serve
+        config = load_config(services=['api'], api=api_address)
+        await serve(config)
 
 
 if __name__ == '__main__':
-    # aa = '127.0.0.1', 1111
-    aa = '192.168.0.100', 1111
-    main_loop = asyncio.get_event_loop()
-    main_loop.run_until_complete(APIServer.run(aa))
+    from services.launcher import main
+    main(['--services', 'api'])
@@ -0,0 +1,183 @@
+import ast
+import asyncio
+import json
+import time
+
+import aiohttp
+import aiohttp.web as web
+
+
+class ServiceClient:
+    """Persistent keep-alive client for making requests to a veryscrape service"""
+    timeout = 10
+
+    def __init__(self, address, timeout=None, retries=3, limit=100, keepalive=60, unix_socket=None):
+        self.url = 'http://{}:{}'.format(*address)
+        self.timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        self.retries = retries
+        self.limit = limit
+        self.keepalive = keepalive
+        self.unix_socket = unix_socket
+        self.session = None
+
+    def connector(self):
+        """Returns connection pool for the session, unix domain socket connector if socket path is provided"""
+        if self.unix_socket is not None:
+            return aiohttp.UnixConnector(path=self.unix_socket, limit=self.limit,
+                                         keepalive_timeout=self.keepalive)
+        return aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit, keepalive_timeout=self.keepalive,
+                                    ttl_dns_cache=300, use_dns_cache=True)
+
+    def get_session(self):
+        """Lazily creates persistent session, this must be called from within a running event loop"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=self.connector(), timeout=self.timeout)
+        return self.session
+
+    async def request(self, method, params=None, retry=None, **kwargs):
+        """Makes request to service, retrying with backoff on connection errors, timeouts and server errors.
+        Only GET requests are retried by default, as a retried POST may be processed twice"""
+        retries = self.retries if (method == 'GET' if retry is None else retry) else 0
+        session = self.get_session()
+        for attempt in range(retries + 1):
+            try:
+                async with session.request(method, self.url, params=params, **kwargs) as resp:
+                    if resp.status >= 500:
+                        resp.raise_for_status()
+                    text = await resp.text()
+                    if resp.status != 200:
+                        raise KeyError(text)
+                    return text
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def get(self, **params):
+        return await self.request('GET', params={k: str(v) for k, v in params.items()})
+
+    async def post(self, params=None, retry=False, **kwargs):
+        return await self.request('POST', params=params, retry=retry, **kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        self.get_session()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class APIClient(ServiceClient):
+    """Client for requesting api keys and topic dictionaries from the api server"""
+    timeout = 10
+
+    async def get_auth(self, source):
+        """Returns api key(s) of source"""
+        return ast.literal_eval(await self.get(q=source))
+
+    async def topics(self, source='topics'):
+        """Returns topic dictionary of source"""
+        return ast.literal_eval(await self.get(q=source))
+
+    async def companies(self):
+        """Returns sorted list of tickers in the topic dictionary"""
+        return list(sorted((await self.topics()).keys()))
+
+    async def classify(self, texts, index='topics', batch_size=1000):
+        """Returns list of tickers matched in each of the provided texts, sent in batches of batch_size texts
+        to keep request bodies well within the server's size limit"""
+        result = []
+        for i in range(0, len(texts), batch_size):
+            # classify is read only, so it is safe to retry
+            resp = await self.post(params={'q': 'classify', 'index': index}, retry=True, json=texts[i:i + batch_size])
+            result.extend(json.loads(resp))
+        return result
+
+    async def add_key(self, key, source):
+        """Registers new api key for source"""
+        return await self.post(params={'q': source}, data={'auth': key})
+
+
+class ProxyClient(ServiceClient):
+    """Client for requesting proxies from the proxy server"""
+    timeout = 5
+
+    async def proxy(self, **proxy_kwargs):
+        """Returns address of next fastest proxy matching provided kwargs"""
+        return await self.get(**proxy_kwargs)
+
+
+class ReceiverClient(ServiceClient):
+    """Client for sending data to and requesting latest data from the receiver"""
+    timeout = 10
+
+    async def send(self, data):
+        """Sends data frame to the receiver"""
+        return await self.post(data=str(data))
+
+    async def latest(self):
+        """Returns latest data frame received by the receiver"""
+        return ast.literal_eval(await self.get())
+
+
+def run_sync(coro):
+    """Runs coroutine to completion in a fresh event loop, for use outside of asynchronous code"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def fetch_companies(api_address):
+    """Blocking helper returning sorted list of tickers from the api server"""
+    async def fetch():
+        async with APIClient(api_address) as api:
+            return await api.companies()
+    return run_sync(fetch())
+
+
+async def benchmark(n_requests=2000, concurrency=50, address=('127.0.0.1', 8765)):
+    """Compares requests/sec of a persistent pooled client against a new connection per request"""
+    async def handler(_):
+        return web.Response(text='http://127.0.0.1:8080')
+
+    server = web.Server(handler)
+    loop = asyncio.get_event_loop()
+    srv = await loop.create_server(server, *address)
+
+    async def run(make_request):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                await make_request()
+        start = time.time()
+        await asyncio.gather(*[one() for _ in range(n_requests)])
+        return n_requests / (time.time() - start)
+
+    async def fresh():
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True)) as sess:
+            async with sess.get('http://{}:{}'.format(*address)) as resp:
+                await resp.text()
+
+    client = ProxyClient(address)
+    pooled = await run(client.proxy)
+    await client.close()
+    new = await run(fresh)
+    srv.close()
+    await srv.wait_closed()
+    await server.shutdown()
+    print('Pooled keep-alive client: {:.0f} req/s'.format(pooled))
+    print('New connection per request: {:.0f} req/s'.format(new))
+    print('Speedup: {:.2f}x'.format(pooled / new))
+
+
+if __name__ == '__main__':
+    main_loop = asyncio.get_event_loop()
+    main_loop.run_until_complete(benchmark())
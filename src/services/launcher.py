@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import stat
+import time
+from datetime import datetime
+
+import aiohttp
+
+from services.api import APIServer
+from services.client import APIClient
+from services.proxy import ProxyServer
+from services.receiver import Receiver
+from services.replay import FrameReader, parse_time
+
+# Services in the order they must be started, they are drained in reverse order
+SERVICES = ['api', 'proxy', 'receiver']
+
+DEFAULTS = {
+    'services': SERVICES,
+    'mode': 'single',
+    'uvloop': False,
+    'api': ('127.0.0.1', 1111),
+    'proxy': ('127.0.0.1', 9999),
+    'receiver': ('127.0.0.1', 9998),
+    # optional unix domain socket paths services also listen on, for low latency calls between co-located services
+    'api_unix': None,
+    'proxy_unix': None,
+    'receiver_unix': None,
+    'data': 'data/',
+    'db': 'sqlite:///data/companyData.db',
+    'proxies_required': 1000,
+    'concurrent_requests': 10,
+    'proxy_snapshot': None,
+    'shutdown_timeout': 10,
+    'max_restarts': 5,
+    'replay': False,
+    'replay_start': None,
+    'replay_end': None,
+    'replay_speed': 1.,
+}
+
+
+def parse_env(key, value):
+    """Converts environment variable string into the type of its config default"""
+    default = DEFAULTS[key]
+    if key in SERVICES:
+        host, port = value.rsplit(':', 1)
+        return host, int(port)
+    if key == 'services':
+        return [i.strip() for i in value.split(',') if i.strip()]
+    if isinstance(default, bool):
+        return value.lower() in ['1', 'true', 'yes']
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def load_config(path=None, **overrides):
+    """Loads service config from defaults, then json config file, then VERYSCRAPE_* environment variables,
+    then provided overrides, later sources taking precedence"""
+    config = dict(DEFAULTS)
+    path = path or os.environ.get('VERYSCRAPE_CONFIG', None)
+    if path is not None:
+        with open(path) as f:
+            config.update(json.load(f))
+    for key in DEFAULTS:
+        value = os.environ.get('VERYSCRAPE_' + key.upper(), None)
+        if value is not None:
+            config[key] = parse_env(key, value)
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    for key in SERVICES:
+        config[key] = tuple(config[key])
+    unknown = set(config['services']) - set(SERVICES)
+    if unknown:
+        raise KeyError('Unknown services: {}'.format(', '.join(sorted(unknown))))
+    return config
+
+
+def use_uvloop(config):
+    """Sets uvloop event loop policy if enabled in config and installed"""
+    if config['uvloop']:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            print('uvloop is not installed, using default asyncio event loop')
+
+
+async def create_service(name, config, stop):
+    """Creates server object of named service, services failing in the background set the stop event"""
+    if name == 'api':
+        return APIServer(config['data'])
+    elif name == 'proxy':
+        server = ProxyServer(config['api'], config['proxy_snapshot'], config['api_unix'])
+        server.start(config['proxies_required'], config['concurrent_requests'], on_failure=stop.set)
+        return server
+    elif name == 'receiver':
+        async with APIClient(config['api'], unix_socket=config['api_unix']) as api:
+            companies = await api.companies()
+        return Receiver(companies, db=config['db'])
+
+
+async def create_unix_server(server, path):
+    """Listens for server requests on unix domain socket at path, replacing a stale socket left by a crash"""
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.remove(path)
+    return await asyncio.get_event_loop().create_unix_server(server, path)
+
+
+async def wait_served(address, timeout=30.):
+    """Waits until service at address has served a request, returns seconds waited.
+    A bodiless POST is rejected by every service without side effects, so any response counts as served"""
+    start = time.perf_counter()
+    url = 'http://{}:{}'.format(*address)
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() - start < timeout:
+            try:
+                async with session.post(url, data='{}') as resp:
+                    await resp.read()
+                return time.perf_counter() - start
+            except (aiohttp.ClientError, OSError):
+                await asyncio.sleep(0.05)
+    raise TimeoutError('Service at {}:{} did not serve a request in time'.format(*address))
+
+
+def start_replay(config, running):
+    """Starts replaying stored frames through the running receiver if replay is enabled, returns the replay task.
+    Without an end time, replay stops at frames stored before launch, as the receiver keeps storing live frames"""
+    receivers = [server for name, server, _ in running if name == 'receiver']
+    if not config['replay'] or not receivers:
+        return None
+    start = parse_time(config['replay_start']) if config['replay_start'] else None
+    end = parse_time(config['replay_end']) if config['replay_end'] else datetime.now()
+    reader = FrameReader(config['db'], start, end)
+    return asyncio.ensure_future(receivers[0].replay(reader, config['replay_speed']))
+
+
+async def serve(config, stop=None, started=None):
+    """Co-hosts configured services on the running event loop until stop is set or SIGTERM/SIGINT is received,
+    then gracefully drains them"""
+    started = started or time.perf_counter()
+    loop = asyncio.get_event_loop()
+    stop = stop or asyncio.Event()
+    signals = []
+    for sig in signal.SIGTERM, signal.SIGINT:
+        try:
+            loop.add_signal_handler(sig, stop.set)
+            signals.append(sig)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass  # not the main thread or not supported on this platform
+
+    running, replaying = [], None
+    try:
+        for name in [i for i in SERVICES if i in config['services']]:
+            server = await create_service(name, config, stop)
+            srvs = []
+            running.append((name, server, srvs))
+            srvs.append(await loop.create_server(server, *config[name]))
+            if config[name + '_unix'] is not None:
+                srvs.append(await create_unix_server(server, config[name + '_unix']))
+        for name, _, _ in running:
+            await wait_served(config[name])
+            print('{} serving on {}:{}, {:.1f}ms since start'.format(
+                name, *config[name], (time.perf_counter() - started) * 1000))
+        replaying = start_replay(config, running)
+        await stop.wait()
+    finally:
+        if replaying is not None:
+            replaying.cancel()
+            await asyncio.gather(replaying, return_exceptions=True)
+        for name, server, srvs in reversed(running):
+            for srv in srvs:
+                srv.close()
+            # close idle keep-alive connections, in-flight requests are given until the timeout to finish
+            for conn in server.connections:
+                conn.close()
+            await server.shutdown(config['shutdown_timeout'])
+            # drain only once no more requests can be handled, so no data is accepted after flushing
+            await server.stop()
+            for srv in srvs:
+                await srv.wait_closed()
+            # only remove the socket if this process was the one listening on it
+            if config[name + '_unix'] is not None and len(srvs) > 1:
+                os.remove(config[name + '_unix'])
+            print('{} stopped'.format(name))
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+
+
+def run_single(config, started=None):
+    """Runs all configured services in this process on one event loop"""
+    use_uvloop(config)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve(config, started=started))
+    finally:
+        loop.close()
+
+
+def run_worker(name, config):
+    """Worker process target running a single service"""
+    # forked workers inherit the supervisor's handlers, restore defaults until the event loop installs its own
+    for sig in signal.SIGTERM, signal.SIGINT:
+        signal.signal(sig, signal.SIG_DFL)
+    run_single(dict(config, services=[name]))
+
+
+def run_supervised(config, started=None):
+    """Runs each configured service in its own worker process, restarting workers that die.
+    SIGTERM/SIGINT is forwarded to the workers as SIGTERM so that each one drains gracefully"""
+    started = started or time.perf_counter()
+    stopping = []
+    handlers = {sig: signal.signal(sig, lambda *_: stopping.append(True)) for sig in (signal.SIGTERM, signal.SIGINT)}
+    workers, restarts = {}, {}
+
+    def spawn(name):
+        worker = multiprocessing.Process(target=run_worker, args=(name, config), name=name)
+        worker.start()
+        workers[name] = worker
+
+    loop = asyncio.new_event_loop()
+    try:
+        for name in [i for i in SERVICES if i in config['services']]:
+            spawn(name)
+            restarts[name] = 0
+            waited = loop.run_until_complete(wait_served(config[name]))
+            print('{} worker (pid {}) serving after {:.1f}ms, {:.1f}ms since start'.format(
+                name, workers[name].pid, waited * 1000, (time.perf_counter() - started) * 1000))
+
+        while not stopping:
+            for name, worker in list(workers.items()):
+                if not worker.is_alive() and not stopping:
+                    if restarts[name] >= config['max_restarts']:
+                        print('{} worker died too many times, shutting down'.format(name))
+                        stopping.append(True)
+                        break
+                    restarts[name] += 1
+                    print('{} worker exited with code {}, restarting'.format(name, worker.exitcode))
+                    time.sleep(min(2 ** restarts[name] / 10, 5))
+                    spawn(name)
+            time.sleep(0.2)
+    finally:
+        for name in reversed(SERVICES):
+            worker = workers.get(name, None)
+            if worker is not None and worker.is_alive():
+                worker.terminate()
+                worker.join(config['shutdown_timeout'])
+                if worker.is_alive():
+                    print('{} worker did not drain in time, killing'.format(name))
+                    worker.kill()
+                    worker.join()
+        loop.close()
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+
+def main(args=None):
+    """Command line entry point for running veryscrape services"""
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description='Run veryscrape services')
+    parser.add_argument('config', nargs='?', default=None, help='path to json config file')
+    parser.add_argument('--services', default=None, help='comma separated services to run, e.g. api,proxy')
+    parser.add_argument('--mode', default=None, choices=['single', 'process'],
+                        help='co-host services on one event loop or run them as supervised worker processes')
+    parser.add_argument('--uvloop', action='store_true', default=None, help='use uvloop event loop if installed')
+    parser.add_argument('--replay', action='store_true', default=None,
+                        help='replay stored frames from the database through the receiver')
+    parser.add_argument('--replay-start', default=None, help='replay frames from this time')
+    parser.add_argument('--replay-end', default=None, help='replay frames up to this time, defaults to launch time')
+    parser.add_argument('--replay-speed', type=float, default=None,
+                        help='replay speed multiplier, 0 for max speed')
+    parsed = parser.parse_args(args)
+
+    services = parse_env('services', parsed.services) if parsed.services else None
+    config = load_config(parsed.config, services=services, mode=parsed.mode, uvloop=parsed.uvloop,
+                         replay=parsed.replay, replay_start=parsed.replay_start, replay_end=parsed.replay_end,
+                         replay_speed=parsed.replay_speed)
+    if config['mode'] == 'process':
+        run_supervised(config, started)
+    else:
+        run_single(config, started)
+
+
+if __name__ == '__main__':
+    main()
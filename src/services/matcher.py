@@ -0,0 +1,105 @@
+import os
+import time
+from collections import deque
+
+
+class TopicMatcher:
+    """Aho-Corasick automaton for finding which tickers' query phrases appear in a piece of text"""
+    def __init__(self, topic_dict):
+        # Reverse index - maps each (lowercased) phrase to the set of tickers it belongs to
+        self.index = {}
+        for topic, queries in topic_dict.items():
+            for q in queries:
+                q = q.strip().lower()
+                if q:
+                    self.index.setdefault(q, set()).add(topic)
+        self.phrases = list(self.index.keys())
+        self.topics = [frozenset(self.index[p]) for p in self.phrases]
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.build()
+
+    def build(self):
+        """Builds the goto, fail and output tables of the automaton from the reverse index"""
+        for pid, phrase in enumerate(self.phrases):
+            node = 0
+            for ch in phrase:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(pid)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def __getitem__(self, phrase):
+        return self.index[phrase.lower()]
+
+    def find(self, text):
+        """Yields (start, end, phrase id) of every whole-word phrase occurrence in text"""
+        text = text.lower()
+        goto, fail, out, phrases = self.goto, self.fail, self.out, self.phrases
+        node = 0
+        n = len(text)
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                after_ok = i + 1 == n or not text[i + 1].isalnum()
+                if not after_ok:
+                    continue
+                for pid in out[node]:
+                    start = i + 1 - len(phrases[pid])
+                    if start == 0 or not text[start - 1].isalnum():
+                        yield start, i + 1, pid
+
+    def match(self, text):
+        """Returns set of tickers whose query phrases appear as whole words in text"""
+        tickers = set()
+        for _, _, pid in self.find(text):
+            tickers.update(self.topics[pid])
+        return tickers
+
+    def classify(self, texts):
+        """Returns sorted list of ticker hits for each text in a batch of texts"""
+        return [sorted(self.match(t)) for t in texts]
+
+
+def benchmark(n_texts=20000, path=os.path.join(os.path.dirname(__file__), 'data', 'topics.txt')):
+    """Measures documents/sec classified using the real topic dictionary on varied generated texts"""
+    with open(path) as f:
+        topics = {t: q.split(',') for t, q in (ln.split(':') for ln in f.read().splitlines())}
+    start = time.time()
+    matcher = TopicMatcher(topics)
+    build = time.time() - start
+    phrases = matcher.phrases
+    filler = 'shares rose after the company reported quarterly earnings above analyst expectations today'.split()
+    texts = [' '.join(filler[:i % len(filler)] + [phrases[(i * 7) % len(phrases)]] + filler[i % len(filler):])
+             for i in range(n_texts)]
+    start = time.time()
+    matcher.classify(texts)
+    rate = n_texts / (time.time() - start)
+    print('Built matcher of {} phrases in {:.1f}ms'.format(len(matcher), build * 1000))
+    print('Classified {} documents at {:.0f} documents/sec'.format(n_texts, rate))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,10 +1,14 @@
 import asyncio
 import heapq
+import json
+import os
 import random
 
 import aiohttp
 import aiohttp.web as web
 
+from services.client import APIClient
+
 
 class ProxyList:
     """Proxy heap that is sorted based on proxy speed"""
@@ -67,10 +71,12 @@ class ProxyList:
 
 class ProxyServer(web.Server):
     """Proxy server - returns a random proxy on GET request filtered by provided params"""
-    def __init__(self, api_addr):
+    def __init__(self, api_addr, snapshot=None, api_unix=None):
         super(ProxyServer, self).__init__(self.process_request)
         self.proxy_list = ProxyList()
-        self.api_server_url = 'http://{}:{}'.format(*api_addr)
+        self.api = APIClient(api_addr, unix_socket=api_unix)
+        self.snapshot = snapshot
+        self.fetcher = None
 
     async def process_request(self, request):
         """Method to execute when a request is received by the server"""
@@ -99,11 +105,9 @@ class ProxyServer(web.Server):
             _ = e  # we don't really care, this should succeed 99.99% of the time
             return None
 
-    async def get_auth(self, session):
+    async def get_auth(self):
         """Gets API key from api server"""
-        async with session.get(self.api_server_url, params={'q': 'proxy'}) as raw:
-            resp = await raw.text()
-        return eval(resp)
+        return await self.api.get_auth('proxy')
 
     async def gather_proxies(self, session, api_key, concurrent_requests=10):
         """Concurrently gathers certain amount of proxies, and adds all correct responses into the proxy list"""
@@ -114,8 +118,9 @@ class ProxyServer(web.Server):
 
     async def fetch_proxies(self, proxies_required=1000, concurrent_requests=10):
         """Daemon loop to constantly keep the proxy list full of good usable proxies"""
-        async with aiohttp.ClientSession() as session:
-            api_key = await self.get_auth(session)
+        connector = aiohttp.TCPConnector(limit=concurrent_requests, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            api_key = await self.get_auth()
             while True:
                 if self.need_proxies(proxies_required):
                     await self.gather_proxies(session, api_key, concurrent_requests)
@@ -124,22 +129,57 @@ class ProxyServer(web.Server):
                     await asyncio.sleep(5)
                 await asyncio.sleep(0)
 
+    def load_snapshot(self):
+        """Adds proxies from snapshot file to the proxy list if a snapshot exists"""
+        if self.snapshot is not None and os.path.exists(self.snapshot):
+            with open(self.snapshot) as f:
+                for proxy in json.load(f):
+                    self.proxy_list.add(proxy)
+
+    def save_snapshot(self):
+        """Atomically writes current proxy list into snapshot file"""
+        if self.snapshot is not None:
+            tmp = self.snapshot + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump([proxy for _, proxy in self.proxy_list.proxies], f)
+            os.replace(tmp, self.snapshot)
+
+    def start(self, proxies_required=1000, concurrent_requests=10, on_failure=None):
+        """Loads proxy snapshot and starts daemon loop filling the proxy list in the background.
+        on_failure is called if the daemon loop dies, as the proxy list would otherwise silently stop refilling"""
+        self.load_snapshot()
+        self.fetcher = asyncio.ensure_future(self.fetch_proxies(proxies_required, concurrent_requests))
+        self.fetcher.add_done_callback(lambda fetcher: self.fetcher_done(fetcher, on_failure))
+
+    @staticmethod
+    def fetcher_done(fetcher, on_failure=None):
+        """Reports failure of the proxy fetching daemon loop"""
+        if fetcher.cancelled() or fetcher.exception() is None:
+            return
+        print('Proxy fetcher failed, {!r}'.format(fetcher.exception()))
+        if on_failure is not None:
+            on_failure()
+
+    async def stop(self):
+        """Drains proxy server - stops fetching proxies and writes proxy snapshot"""
+        if self.fetcher is not None and not self.fetcher.done():
+            self.fetcher.cancel()
+            try:
+                await self.fetcher
+            except asyncio.CancelledError:
+                pass
+        await self.api.close()
+        self.save_snapshot()
+
     @staticmethod
     async def run(proxy_address, api_address, proxies_required=1000, concurrent_requests=10):
-        """Main server running function - creates and runs proxy server asynchronously"""
-        server = ProxyServer(api_address)
-        loop = asyncio.get_event_loop()
-        await loop.create_server(server, *proxy_address)
-        await server.fetch_proxies(proxies_required, concurrent_requests)
-        await server.shutdown()
-        loop.close()
+        """Main server running function - creates and runs proxy server asynchronously until stopped"""
+        from services.launcher import load_config, serve
+        config = load_config(services=['proxy'], proxy=proxy_address, api=api_address,
+                             proxies_required=proxies_required, concurrent_requests=concurrent_requests)
+        await serve(config)
 
 
 if __name__ == '__main__':
-    # pa = '127.0.0.1', 9999
-    # aa = '127.0.0.1', 1111
-    pa = '192.168.0.100', 9999
-    aa = '192.168.0.100', 1111
-    p_required, c_requests = 1000, 10
-    main_loop = asyncio.get_event_loop()
-    main_loop.run_until_complete(ProxyServer.run(pa, aa, p_required, c_requests))
+    from services.launcher import main
+    main(['--services', 'proxy'])
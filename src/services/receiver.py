@@ -1,21 +1,24 @@
 import asyncio
+from queue import Queue
 
 import aiohttp.web as web
-import requests
 
 from services.receiver_extensions import QueueDBWriter, StockGymEndPoint
+from services.replay import Replayer, put_latest
 
 
 class Receiver(web.Server):
-    topic_url = 'http://127.0.0.1:1111'
-    companies = list(sorted(eval(requests.get(topic_url, params={'q': 'topics'}).text).keys()))
-
-    def __init__(self, **kwargs):
+    def __init__(self, companies, db='sqlite:///data/companyData.db', **kwargs):
         super(Receiver, self).__init__(self.process_request, **kwargs)
+        self.companies = companies
         self.queues = [asyncio.Queue() for _ in range(4)]
+        # the gym end point reads from its own thread, so it gets a thread-safe bounded queue
+        self.queues[1] = Queue(maxsize=StockGymEndPoint.max_items_in_queue)
         self.expected_keys = ['article', 'blog', 'reddit', 'twitter', 'stock']
-        QueueDBWriter(self.queues[0], self.companies).start()
-        StockGymEndPoint(self.queues[1]).start()
+        self.db_writer = QueueDBWriter(self.queues[0], self.companies, db)
+        self.gym = StockGymEndPoint(self.queues[1])
+        self.db_writer.start()
+        self.gym.start()
         # Thread(target=lambda: Controller(self.queues[2]).mainloop()).start()
 
     async def on_post(self, request):
@@ -24,7 +27,10 @@ class Receiver(web.Server):
         assert set(json.keys()) == set(self.expected_keys)
         print(json.copy().popitem()[1].copy().popitem())
         for queue in self.queues:
-            await queue.put(json)
+            if queue is self.gym.queue:
+                put_latest(queue, json, self.gym.max_items_in_queue)
+            else:
+                await queue.put(json)
         return web.Response(text='Success!', status=200)
 
     async def on_get(self):
@@ -48,23 +54,30 @@ class Receiver(web.Server):
         except (TypeError, AssertionError):
             return web.Response(text="Incorrectly formatted request", status=404)
 
-    @staticmethod
-    async def run(address):
+    async def replay(self, reader, speed=1.):
+        """Replays stored frames from reader through the receiver's consumers, excluding the database writer.
+        The gym receives every frame, its bounded queue pacing the replay to the gym, while the other consumers
+        only ever have the newest frames queued so memory stays flat at any speed"""
+        replayer = Replayer([self.gym.queue], reader, speed, latest=self.queues[2:], keep=self.gym.max_items_in_queue)
+        await replayer.run()
+        print('Replayed {} frames in {:.2f}s, {:.0f} frames/sec'.format(
+            replayer.n_frames, replayer.seconds, replayer.frames_per_second))
+        return replayer
+
+    async def stop(self):
+        """Drains receiver - flushes remaining data into the database and closes the gym end point"""
         loop = asyncio.get_event_loop()
-        server = Receiver()
+        await loop.run_in_executor(None, self.gym.stop)
+        await loop.run_in_executor(None, self.db_writer.stop)
 
-        await loop.create_server(server, *address)
-        while True:
-            try:
-                await asyncio.sleep(60)
-            except KeyboardInterrupt:
-                break
-        await server.shutdown()
-        loop.close()
+    @staticmethod
+    async def run(address, api_address=None):
+        """Main server running function - creates and runs receiver server asynchronously until stopped"""
+        from services.launcher import load_config, serve
+        config = load_config(services=['receiver'], receiver=address, api=api_address)
+        await serve(config)
 
 
 if __name__ == '__main__':
-    add = '127.0.0.1', 9999
-    #add = '192.168.1.53', 9999
-    main_loop = asyncio.get_event_loop()
-    main_loop.run_until_complete(Receiver.run(add))
+    from services.launcher import main
+    main(['--services', 'receiver'])
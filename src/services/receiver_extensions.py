@@ -1,3 +1,4 @@
+import socket
 from collections import deque
 from datetime import datetime
 from multiprocessing.connection import Listener
@@ -7,12 +8,13 @@ from sqlalchemy import create_engine, Table, MetaData, Column, Float, DateTime
 
 
 class QueueDBWriter(Thread):
-    def __init__(self, queue, companies):
+    def __init__(self, queue, companies, db='sqlite:///data/companyData.db'):
         super(QueueDBWriter, self).__init__()
         self.queue = queue
         self.companies = companies
+        self.running = True
 
-        self.db = create_engine('sqlite:///data/companyData.db')
+        self.db = create_engine(db)
         self.db.echo = False
 
         self.table_names = ['article', 'blog', 'twitter', 'reddit', 'stock']
@@ -24,31 +26,45 @@ class QueueDBWriter(Thread):
             if t not in self.db.table_names():
                 self.tables[t].create()
 
-    def update_database(self, data):
-        current_time = datetime.now()
+    def update_database(self, data, current_time=None):
+        current_time = current_time or datetime.now()
         for k in self.tables:
             i = self.tables[k].insert()
             data[k].update(time=current_time)
             i.execute(data[k])
 
+    def flush(self):
+        """Writes all data remaining in the queue into the database"""
+        while not self.queue.empty():
+            self.update_database(self.queue.get_nowait())
+
+    def stop(self):
+        """Stops writer thread once all remaining data has been written"""
+        self.running = False
+        self.join()
+
     def run(self):
-        while True:
+        while self.running:
             if not self.queue.empty():
                 data = self.queue.get_nowait()
                 self.update_database(data)
+        self.flush()
 
 
 class StockGymEndPoint(Thread):
+    max_items_in_queue = 10
+
     def __init__(self, queue):
-        super(StockGymEndPoint, self).__init__()
+        super(StockGymEndPoint, self).__init__(daemon=True)
         self.queue = queue
-        self.max_items_in_queue = 10
+        self.running = True
 
-        self.server = Listener(('localhost', 6100), authkey=b'veryscrape')
+        self.address = 'localhost', 6100
+        self.server = Listener(self.address, authkey=b'veryscrape')
         self.conn = None
 
     def accept_next(self):
-        while True:
+        while self.running:
             try:
                 self.conn = self.server.accept()
                 break
@@ -62,9 +78,19 @@ class StockGymEndPoint(Thread):
         for item in allowed_items:
             self.queue.put(item)
 
+    def stop(self):
+        """Stops the end point, waking a blocked accept with a dummy connection so that the port is released"""
+        self.running = False
+        try:
+            socket.create_connection(self.address, timeout=1).close()
+        except OSError:
+            pass
+        self.join(1)
+        self.server.close()
+
     def run(self):
         self.accept_next()
-        while True:
+        while self.running:
             if self.queue.qsize() > self.max_items_in_queue:
                 self.decrease_queue_size()
             else:
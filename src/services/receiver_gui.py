@@ -3,15 +3,16 @@ from functools import partial
 from multiprocessing import Queue
 from threading import Thread
 
-import requests
+from services.client import fetch_companies
 
 RED, GREEN = '#ff8080', '#9fff80'
 
 
 class ItemGUI(Thread):
-    def __init__(self, queue, *args, **kwargs):
+    def __init__(self, queue, companies, *args, **kwargs):
         super(ItemGUI, self).__init__(*args, **kwargs)
         self.queue = queue
+        self.companies = companies
 
     def run_app(self):
         app = tk.Tk()
@@ -22,19 +23,17 @@ class ItemGUI(Thread):
         app.mainloop()
 
     def run_status_gui(self):
-        Thread(target=StatusGUI, args=(self.queue,)).start()
+        Thread(target=StatusGUI, args=(self.queue, self.companies)).start()
 
     def run(self):
         self.run_app()
 
 
 class StatusGUI(tk.Tk):
-    api_server_url = 'http://127.0.0.1:1111'
-    companies = list(sorted(eval(requests.get(api_server_url, params={'q': 'topics'}).text).keys()))
-
-    def __init__(self, queue, *args, **kwargs):
+    def __init__(self, queue, companies, *args, **kwargs):
         super(StatusGUI, self).__init__(*args, **kwargs)
         self.queue = queue
+        self.companies = companies
         self.status_frame = StreamStatusPage(self)
         self.puller = Thread(target=self.pull)
         self.running = True
@@ -130,5 +129,6 @@ class StreamStatusPage(tk.Frame):
 
 
 if __name__ == '__main__':
+    api_address = '127.0.0.1', 1111
     q = Queue()
-    ItemGUI(q).start()
+    ItemGUI(q, fetch_companies(api_address)).start()
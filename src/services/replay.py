@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, MetaData, Table, select
+
+from services.receiver_extensions import StockGymEndPoint
+
+
+class FrameReader:
+    """Reads frames stored by QueueDBWriter in time order, one chunk of rows per table at a time"""
+    def __init__(self, db='sqlite:///data/companyData.db', start=None, end=None, chunk_size=1000):
+        self.db = create_engine(db)
+        self.db.echo = False
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size
+        self.table_names = ['article', 'blog', 'reddit', 'twitter', 'stock']
+        self.tables = {t: Table(t, MetaData(self.db), autoload=True) for t in self.table_names}
+
+    @property
+    def companies(self):
+        """Sorted list of companies stored in the database"""
+        return list(sorted(c.name for c in self.tables['stock'].columns if c.name != 'time'))
+
+    def read_table(self, name):
+        """Yields rows of table in time order, using keyset pagination so that only one chunk is held in memory"""
+        table = self.tables[name]
+        last = None
+        while True:
+            query = select([table]).order_by(table.c.time).limit(self.chunk_size)
+            if last is not None:
+                query = query.where(table.c.time > last)
+            elif self.start is not None:
+                query = query.where(table.c.time >= self.start)
+            if self.end is not None:
+                query = query.where(table.c.time <= self.end)
+            rows = self.db.execute(query).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < self.chunk_size:
+                break
+            last = rows[-1]['time']
+
+    def __iter__(self):
+        """Yields (time, frame) pairs, frames have the same form as the data posted to the receiver.
+        Rows of all tables written at the same time are merged into one frame, incomplete frames are skipped"""
+        readers = {t: self.read_table(t) for t in self.table_names}
+        heads = {t: next(readers[t], None) for t in self.table_names}
+        while all(heads[t] is not None for t in self.table_names):
+            current = min(heads[t]['time'] for t in self.table_names)
+            frame = {}
+            for t in self.table_names:
+                if heads[t]['time'] == current:
+                    row = heads[t]
+                    heads[t] = next(readers[t], None)
+                    frame[t] = {k: v for k, v in row.items() if k != 'time'}
+            if len(frame) == len(self.table_names):
+                yield current, frame
+
+    def chunks(self):
+        """Yields lists of up to chunk_size (time, frame) pairs"""
+        chunk = []
+        for item in self:
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+async def put_wait(q, frame):
+    """Puts frame on queue, waiting while a bounded queue is full so that a slow consumer applies backpressure.
+    Works for asyncio, thread and process queues as it never blocks the event loop"""
+    while True:
+        try:
+            q.put_nowait(frame)
+            return
+        except (asyncio.QueueFull, queue.Full):
+            await asyncio.sleep(0.01)
+
+
+def put_latest(q, frame, keep=1):
+    """Puts frame on queue, discarding the oldest frames so that at most keep frames are queued"""
+    while q.qsize() >= keep:
+        try:
+            q.get_nowait()
+        except (asyncio.QueueEmpty, queue.Empty):
+            break
+    q.put_nowait(frame)
+
+
+class Replayer:
+    """Streams stored frames from a FrameReader into consumer queues at real-time, scaled or max speed.
+    Every frame is delivered to queues, bounded queues applying backpressure to the replay, while latest
+    queues are for consumers that only want the newest frames and never hold more than keep frames"""
+    def __init__(self, queues, reader, speed=1., latest=(), keep=1):
+        self.queues = queues
+        self.latest = latest
+        self.keep = keep
+        self.reader = reader
+        # speed of 1 replays at real-time, k replays k times faster, None or 0 replays as fast as possible
+        self.speed = speed
+        self.n_frames = 0
+        self.seconds = 0.
+
+    @property
+    def frames_per_second(self):
+        return self.n_frames / self.seconds if self.seconds else 0.
+
+    async def run(self):
+        """Replays all frames of the reader, database reads are done in an executor to keep the loop responsive"""
+        loop = asyncio.get_event_loop()
+        chunks = self.reader.chunks()
+        started = time.perf_counter()
+        first = None
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            for frame_time, frame in chunk:
+                if self.speed:
+                    first = first or frame_time
+                    target = started + (frame_time - first).total_seconds() / self.speed
+                    delay = target - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                for q in self.queues:
+                    await put_wait(q, frame)
+                for q in self.latest:
+                    put_latest(q, frame, self.keep)
+                self.n_frames += 1
+            await asyncio.sleep(0)
+        self.seconds = time.perf_counter() - started
+        return self.n_frames
+
+
+def parse_time(s):
+    """Parses date or date and time string from the command line"""
+    for fmt in '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d':
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    raise ValueError('Incorrectly formatted time, {}'.format(s))
+
+
+async def replay(reader, speed, gym=True, gui=False):
+    """Replays frames into the stock gym end point and/or the status gui.
+    The gym receives every frame through a bounded queue, so the replay waits for a gym to connect and keep up,
+    the gui only shows the newest frame"""
+    queues, latest = [], []
+    if gym:
+        gym_queue = queue.Queue(maxsize=StockGymEndPoint.max_items_in_queue)
+        StockGymEndPoint(gym_queue).start()
+        queues.append(gym_queue)
+    if gui:
+        # tkinter is only required when replaying into the gui
+        from services.receiver_gui import ItemGUI
+        gui_queue = multiprocessing.Queue()
+        ItemGUI(gui_queue, reader.companies).start()
+        latest.append(gui_queue)
+    replayer = Replayer(queues, reader, speed, latest=latest)
+    await replayer.run()
+    print('Replayed {} frames in {:.2f}s, {:.0f} frames/sec'.format(
+        replayer.n_frames, replayer.seconds, replayer.frames_per_second))
+    return replayer
+
+
+def main(args=None):
+    """Command line entry point for replaying stored data into the stock gym and/or status gui"""
+    parser = argparse.ArgumentParser(description='Replay stored veryscrape data')
+    parser.add_argument('--db', default='sqlite:///data/companyData.db', help='database url of stored data')
+    parser.add_argument('--start', type=parse_time, default=None, help='replay frames from this time')
+    parser.add_argument('--end', type=parse_time, default=None, help='replay frames up to this time')
+    parser.add_argument('--speed', type=float, default=1., help='replay speed multiplier, 0 for max speed')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows read from the database at a time')
+    parser.add_argument('--no-gym', dest='gym', action='store_false', help='do not replay into the stock gym')
+    parser.add_argument('--gui', action='store_true', help='replay into the status gui')
+    parsed = parser.parse_args(args)
+
+    reader = FrameReader(parsed.db, parsed.start, parsed.end, parsed.chunk_size)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(replay(reader, parsed.speed, parsed.gym, parsed.gui))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,16 @@
+import asyncio
+import json
+import os
+import shutil
+import stat
+import tempfile
 import unittest
+import unittest.mock as mock
 
 import aiohttp
 
+from services.api import APIServer, FileKeeper
+from services.client import APIClient
 from servicetests import synchronous
 
 
@@ -28,3 +37,167 @@ class TestAPI(unittest.TestCase):
         async with aiohttp.ClientSession() as sess:
             async with sess.get(self.server, params={'a': 1}) as resp:
                 assert resp.status == 404, 'Incorrect request for api key failed'
+
+
+class TestFileKeeper(unittest.TestCase):
+    """Test case for testing api key updates of FileKeeper"""
+    key = 'abcd1234-ab12-cd34-ef56-abcdef123456'
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'proxy.txt'), 'w') as f:
+            f.write('11111111-1111-1111-1111-111111111111\n')
+        with open(os.path.join(self.dir, 'twingly.txt'), 'w') as f:
+            f.write('22222222-2222-2222-2222-222222222222\n')
+        with open(os.path.join(self.dir, 'topics.txt'), 'w') as f:
+            f.write('FB:facebook,whatsapp\n')
+        self.files = FileKeeper(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, source):
+        with open(os.path.join(self.dir, source + '.txt')) as f:
+            return f.read().splitlines()
+
+    @synchronous
+    async def test_update_invalid_key(self):
+        """Tests whether an incorrectly formatted key is rejected without touching the file"""
+        with self.assertRaises(KeyError):
+            await self.files.update('not-a-key', 'proxy')
+        assert len(self.read('proxy')) == 1, 'Invalid key was written to file'
+
+    @synchronous
+    async def test_update_refreshes_memory(self):
+        """Tests whether an update is reflected in both in-memory data and pre-encoded response"""
+        await self.files.update(self.key, 'proxy')
+        assert self.files['proxy'][-1] == [self.key], 'In-memory data not refreshed'
+        assert self.key.encode() in self.files.response('proxy'), 'Pre-encoded response not refreshed'
+        await self.files.update(self.key, 'twingly')
+        assert self.read('twingly') == [self.key], 'Twingly key was not overwritten'
+        assert self.files['twingly'] == '"{}"'.format(self.key), 'In-memory twingly key not refreshed'
+
+    @synchronous
+    async def test_concurrent_updates(self):
+        """Tests whether concurrent updates to one source are all written without interleaving"""
+        keys = ['{:08d}-ab12-cd34-ef56-abcdef123456'.format(i) for i in range(50)]
+        await asyncio.gather(*[self.files.update(k, 'proxy') for k in keys])
+        lines = self.read('proxy')
+        assert len(lines) == 51 and set(keys) <= set(lines), 'Concurrent updates were lost or interleaved'
+        assert len(self.files['proxy']) == 51, 'In-memory data out of sync with file'
+        assert sorted(os.listdir(self.dir)) == ['proxy.txt', 'topics.txt', 'twingly.txt'], \
+            'Temporary files were left behind'
+
+    @synchronous
+    async def test_update_topic_dictionary(self):
+        """Tests whether a schema valid key is rejected for topic dictionaries and leaves them untouched"""
+        with self.assertRaises(KeyError):
+            await self.files.update(self.key, 'topics')
+        assert self.read('topics') == ['FB:facebook,whatsapp'], 'Topic dictionary was modified'
+        assert FileKeeper(self.dir)['topics'] == {'FB': ['facebook', 'whatsapp']}, 'Reloaded topic dictionary changed'
+
+    @synchronous
+    async def test_update_keeps_file_mode(self):
+        """Tests whether replacing a key file keeps its permissions"""
+        path = os.path.join(self.dir, 'proxy.txt')
+        os.chmod(path, 0o644)
+        await self.files.update(self.key, 'proxy')
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644, 'File permissions changed by update'
+
+    @synchronous
+    async def test_failed_write_removes_temporary_file(self):
+        """Tests whether the temporary file is removed when the write fails"""
+        with mock.patch('os.replace', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await self.files.update(self.key, 'proxy')
+        assert sorted(os.listdir(self.dir)) == ['proxy.txt', 'topics.txt', 'twingly.txt'], \
+            'Temporary file was left behind'
+        assert self.read('proxy') == ['11111111-1111-1111-1111-111111111111'], 'Key file modified by failed write'
+
+
+class TestClassify(unittest.TestCase):
+    """Test case for testing the batch classify endpoint of APIServer"""
+    @synchronous
+    async def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'topics.txt'), 'w') as f:
+            f.write('FB:facebook,whatsapp\nGE:general electric,ge\n')
+        self.server = APIServer(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_classify_returns_json(self):
+        """Tests whether classify answers with a json list of ticker hits per text"""
+        result = self.server.on_classify({}, ['facebook and GE', 'nothing'])
+        assert json.loads(result) == [['FB', 'GE'], []], 'Incorrect classify response, {}'.format(result)
+
+    def test_classify_incorrect_body(self):
+        """Tests whether a body that is not a list of texts is rejected"""
+        with self.assertRaises(TypeError):
+            self.server.on_classify({}, {'text': 'facebook'})
+
+
+class TestClassifyServer(unittest.TestCase):
+    """Test case for testing the classify endpoint through a running APIServer"""
+    address = '127.0.0.1', 11314
+
+    @synchronous
+    async def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'topics.txt'), 'w') as f:
+            f.write('FB:facebook,whatsapp\nGE:general electric,ge\n')
+        with open(os.path.join(self.dir, 'subreddits.txt'), 'w') as f:
+            f.write('FB:facebook,zuckerberg\nGE:generalelectric\n')
+        self.server = APIServer(self.dir)
+        self.srv = await asyncio.get_event_loop().create_server(self.server, *self.address)
+        self.url = 'http://{}:{}'.format(*self.address)
+
+    @synchronous
+    async def tearDown(self):
+        self.srv.close()
+        await self.server.shutdown()
+        await self.srv.wait_closed()
+        shutil.rmtree(self.dir)
+
+    async def post(self, params, data):
+        async with aiohttp.ClientSession() as sess:
+            async with sess.post(self.url, params=params, data=data) as resp:
+                return resp.status, await resp.text()
+
+    @synchronous
+    async def test_classify_topics(self):
+        """Tests whether a json list of texts is classified with the topic dictionary by default"""
+        status, text = await self.post({'q': 'classify'}, json.dumps(['facebook and ge', 'zuckerberg']))
+        assert status == 200, 'Classify request failed, {}'.format(status)
+        assert json.loads(text) == [['FB', 'GE'], []], 'Incorrect classification, {}'.format(text)
+
+    @synchronous
+    async def test_classify_subreddits(self):
+        """Tests whether the index parameter selects the subreddit dictionary"""
+        status, text = await self.post({'q': 'classify', 'index': 'subreddits'}, json.dumps(['zuckerberg']))
+        assert status == 200 and json.loads(text) == [['FB']], 'Incorrect classification, {}'.format(text)
+
+    @synchronous
+    async def test_classify_incorrect_requests(self):
+        """Tests whether unknown indexes and malformed json are rejected"""
+        status, _ = await self.post({'q': 'classify', 'index': 'nothing'}, json.dumps(['facebook']))
+        assert status == 404, 'Unknown index not rejected, {}'.format(status)
+        status, _ = await self.post({'q': 'classify'}, '["facebook", ')
+        assert status == 404, 'Malformed json not rejected, {}'.format(status)
+
+    @synchronous
+    async def test_classify_large_batch(self):
+        """Tests whether batches larger than aiohttp's default body limit are classified"""
+        texts = ['shares of general electric rose after facebook reported earnings'] * 40000
+        status, text = await self.post({'q': 'classify'}, json.dumps(texts))
+        assert status == 200, 'Large classify batch rejected, {}'.format(status)
+        assert len(json.loads(text)) == len(texts), 'Not all texts were classified'
+
+    @synchronous
+    async def test_client_classify_batches(self):
+        """Tests whether the api client splits texts into batches and joins the results in order"""
+        texts = ['facebook', 'nothing', 'general electric'] * 5
+        async with APIClient(self.address) as client:
+            result = await client.classify(texts, batch_size=4)
+        assert result == [['FB'], [], ['GE']] * 5, 'Batched classification incorrect, {}'.format(result)
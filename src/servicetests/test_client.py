@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+import unittest.mock as mock
+
+import aiohttp
+import aiohttp.web as web
+
+from services.client import APIClient, ProxyClient, ReceiverClient
+from servicetests import synchronous
+
+
+class MockResponse:
+    """Minimal stand-in for an aiohttp response used as an async context manager"""
+    def __init__(self, status, text):
+        self.status = status
+        self._text = text
+
+    async def text(self):
+        return self._text
+
+    def raise_for_status(self):
+        raise aiohttp.ClientResponseError(mock.MagicMock(), (), status=self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class TestServiceClient(unittest.TestCase):
+    """Test case for testing request handling and retries of service clients"""
+    address = '127.0.0.1', 1111
+
+    def client(self, cls, *responses):
+        client = cls(self.address, retries=2)
+        client.session = mock.MagicMock(closed=False)
+        client.session.request.side_effect = list(responses)
+        return client
+
+    @synchronous
+    async def test_get_auth(self):
+        """Tests whether api key response is correctly parsed"""
+        client = self.client(APIClient, MockResponse(200, '"abc"'))
+        assert await client.get_auth('proxy') == 'abc', 'Api key not correctly parsed'
+        assert client.session.request.call_args[1]['params'] == {'q': 'proxy'}, 'Incorrect request params'
+
+    @synchronous
+    async def test_retry_on_server_error(self):
+        """Tests whether connection and server errors are retried on the same session"""
+        client = self.client(ProxyClient, aiohttp.ClientConnectionError(), MockResponse(503, ''),
+                             MockResponse(200, 'http://1.2.3.4:80'))
+        assert await client.proxy(https=True) == 'http://1.2.3.4:80', 'Did not retry failed requests'
+        assert client.session.request.call_count == 3, 'Incorrect number of attempts'
+        assert client.session.request.call_args[1]['params'] == {'https': 'True'}, 'Params not sent as strings'
+
+    @synchronous
+    async def test_post_not_retried(self):
+        """Tests whether a failed POST is not retried unless the caller opts in"""
+        client = self.client(ReceiverClient, aiohttp.ClientConnectionError(), MockResponse(200, 'Success!'))
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            await client.send({'stock': {}})
+        assert client.session.request.call_count == 1, 'Non idempotent POST was retried'
+        assert await client.post(retry=True) == 'Success!', 'Opted in POST was not retried'
+
+    @synchronous
+    async def test_retries_exhausted(self):
+        """Tests whether the last error is raised once all retries have been used"""
+        client = self.client(ProxyClient, *[aiohttp.ClientConnectionError() for _ in range(3)])
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            await client.proxy()
+
+    @synchronous
+    async def test_incorrect_request(self):
+        """Tests whether a rejected request raises KeyError without being retried"""
+        client = self.client(APIClient, MockResponse(404, 'Incorrect request'))
+        with self.assertRaises(KeyError):
+            await client.get_auth('nothing')
+        assert client.session.request.call_count == 1, 'Rejected request was retried'
+
+
+class TestServiceClientServer(unittest.TestCase):
+    """Test case for testing service clients against a real server"""
+    address = '127.0.0.1', 11312
+
+    @synchronous
+    async def setUp(self):
+        self.requests = []
+        self.server = web.Server(self.handler)
+        self.srv = await asyncio.get_event_loop().create_server(self.server, *self.address)
+
+    @synchronous
+    async def tearDown(self):
+        self.srv.close()
+        await self.server.shutdown()
+        await self.srv.wait_closed()
+
+    async def handler(self, request):
+        self.requests.append((request.method, dict(request.query)))
+        if request.method == 'POST':
+            return web.Response(text='Failed!', status=503)
+        return web.Response(text='http://1.2.3.4:80', status=200)
+
+    @synchronous
+    async def test_proxy_boolean_kwargs(self):
+        """Tests whether boolean and numeric proxy kwargs are sent as query params"""
+        async with ProxyClient(self.address) as client:
+            assert await client.proxy(https=True, speed=100) == 'http://1.2.3.4:80', 'Proxy not returned'
+        assert self.requests == [('GET', {'https': 'True', 'speed': '100'})], 'Incorrect request, {}'.format(
+            self.requests)
+
+    @synchronous
+    async def test_post_server_error_not_retried(self):
+        """Tests whether a POST answered with a server error is sent only once"""
+        async with ReceiverClient(self.address) as client:
+            with self.assertRaises(aiohttp.ClientResponseError):
+                await client.send({'stock': {}})
+        assert len(self.requests) == 1, 'POST was sent {} times'.format(len(self.requests))
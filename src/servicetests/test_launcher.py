@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock as mock
+from datetime import datetime
+
+import aiohttp
+from sqlalchemy import create_engine
+
+from services.client import APIClient, ReceiverClient
+from services.launcher import load_config, serve, wait_served
+from services.proxy import ProxyServer
+from services.receiver import Receiver
+from servicetests import synchronous
+from servicetests.test_proxy import generate_random_proxy
+
+
+class TestLoadConfig(unittest.TestCase):
+    """Test case for testing loading of service config from file, environment and overrides"""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'config.json')
+        with open(self.path, 'w') as f:
+            json.dump({'api': ['0.0.0.0', 2222], 'mode': 'process'}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_defaults(self):
+        """Tests whether default config has no conflicting service addresses"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            config = load_config()
+        addresses = [config[i] for i in ['api', 'proxy', 'receiver']]
+        assert len(set(addresses)) == 3, 'Services share an address, {}'.format(addresses)
+        assert config['mode'] == 'single', 'Services not co-hosted by default'
+
+    def test_precedence(self):
+        """Tests whether environment variables override config file and overrides take precedence over both"""
+        env = {'VERYSCRAPE_API': '10.0.0.1:3333', 'VERYSCRAPE_SERVICES': 'api, proxy', 'VERYSCRAPE_UVLOOP': 'true'}
+        with mock.patch.dict(os.environ, env, clear=True):
+            config = load_config(self.path)
+            assert config['api'] == ('10.0.0.1', 3333), 'Environment did not override config file'
+            assert config['mode'] == 'process', 'Config file not loaded'
+            assert config['services'] == ['api', 'proxy'], 'Services not parsed from environment'
+            assert config['uvloop'] is True, 'Boolean not parsed from environment'
+            config = load_config(self.path, api=('127.0.0.1', 4444))
+            assert config['api'] == ('127.0.0.1', 4444), 'Override did not take precedence'
+
+    def test_unknown_service(self):
+        """Tests whether config with unknown service is rejected"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            with self.assertRaises(KeyError):
+                load_config(services=['api', 'nothing'])
+
+
+class TestServe(unittest.TestCase):
+    """Test case for testing co-hosting and graceful shutdown of services on one event loop"""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'proxy.txt'), 'w') as f:
+            f.write('11111111-1111-1111-1111-111111111111\n')
+        self.config = load_config(services=['api'], api=('127.0.0.1', 11311), data=self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    @synchronous
+    async def test_serve_until_stopped(self):
+        """Tests whether served api answers requests and is shut down once stop is set"""
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(serve(self.config, stop))
+        url = 'http://{}:{}'.format(*self.config['api'])
+        async with aiohttp.ClientSession() as sess:
+            for _ in range(100):
+                try:
+                    async with sess.get(url, params={'q': 'proxy'}) as resp:
+                        text = await resp.text()
+                    break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.05)
+            assert text == '"11111111-1111-1111-1111-111111111111"', 'Co-hosted api did not serve request'
+            stop.set()
+            await asyncio.wait_for(task, 10)
+            with self.assertRaises(aiohttp.ClientError):
+                async with sess.get(url, params={'q': 'proxy'}) as resp:
+                    await resp.text()
+
+    @synchronous
+    async def test_serve_unix_socket(self):
+        """Tests whether a service configured with a unix socket serves requests on it and removes it when stopped"""
+        path = os.path.join(self.dir, 'api.sock')
+        config = dict(self.config, api_unix=path)
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(serve(config, stop))
+        await wait_served(config['api'])
+        async with APIClient(('localhost', 0), unix_socket=path) as client:
+            key = await client.get_auth('proxy')
+        assert key == '11111111-1111-1111-1111-111111111111', 'Incorrect key served over unix socket'
+        stop.set()
+        await asyncio.wait_for(task, 10)
+        assert not os.path.exists(path), 'Unix socket was not removed'
+
+    @synchronous
+    async def test_serve_proxy_snapshot(self):
+        """Tests whether proxies gathered while serving are written to the snapshot on drain and reloaded"""
+        path = os.path.join(self.dir, 'proxies.json')
+        config = load_config(services=['api', 'proxy'], api=('127.0.0.1', 11311), proxy=('127.0.0.1', 11315),
+                             data=self.dir, proxy_snapshot=path, proxies_required=20)
+        proxies = [generate_random_proxy() for _ in range(20)]
+
+        async def gather_proxies(server, *_):
+            for proxy in proxies:
+                server.proxy_list.add(proxy)
+
+        stop = asyncio.Event()
+        with mock.patch.object(ProxyServer, 'gather_proxies', gather_proxies):
+            task = asyncio.ensure_future(serve(config, stop))
+            await wait_served(config['proxy'])
+            await asyncio.sleep(0.1)
+            stop.set()
+            await asyncio.wait_for(task, 10)
+
+        server = ProxyServer(config['api'], path)
+        server.load_snapshot()
+        reloaded = {proxy['ip'] for _, proxy in server.proxy_list.proxies}
+        assert reloaded == {proxy['ip'] for proxy in proxies}, 'Gathered proxies not reloaded from snapshot'
+
+    @synchronous
+    async def test_proxy_fetcher_failure_stops_serve(self):
+        """Tests whether serving stops instead of silently running without a proxy fetcher when the fetcher dies"""
+        config = load_config(services=['api', 'proxy'], api=('127.0.0.1', 11311), proxy=('127.0.0.1', 11315),
+                             data=self.dir)
+        with mock.patch.object(ProxyServer, 'get_auth', mock.MagicMock(side_effect=KeyError('proxy'))):
+            await asyncio.wait_for(serve(config), 10)
+
+    @synchronous
+    async def test_frame_posted_during_shutdown_reaches_db(self):
+        """Tests whether a frame whose request is still being handled when shutdown starts reaches the database"""
+        with open(os.path.join(self.dir, 'topics.txt'), 'w') as f:
+            f.write('FB:facebook\nGE:general electric\n')
+        db = 'sqlite:///' + os.path.join(self.dir, 'companyData.db')
+        config = load_config(services=['api', 'receiver'], api=('127.0.0.1', 11311),
+                             receiver=('127.0.0.1', 11313), data=self.dir, db=db)
+        on_post = Receiver.on_post
+
+        async def slow_on_post(receiver, request):
+            await asyncio.sleep(0.3)
+            return await on_post(receiver, request)
+
+        frame = str({k: {'FB': 1., 'GE': 2.} for k in ['article', 'blog', 'reddit', 'twitter', 'stock']})
+        stop = asyncio.Event()
+        with mock.patch.object(Receiver, 'on_post', slow_on_post):
+            task = asyncio.ensure_future(serve(config, stop))
+            await wait_served(config['receiver'])
+            async with ReceiverClient(config['receiver']) as client:
+                post = asyncio.ensure_future(client.send(frame))
+                await asyncio.sleep(0.1)
+                stop.set()
+                assert await post == 'Success!', 'Frame not accepted during shutdown'
+            await asyncio.wait_for(task, 10)
+
+        count = create_engine(db).execute('select count(*) from stock').scalar()
+        assert count == 1, 'Frame posted during shutdown did not reach the database'
+
+    @synchronous
+    async def test_serve_replay(self):
+        """Tests whether enabling replay replays the configured time range through the receiver"""
+        with open(os.path.join(self.dir, 'topics.txt'), 'w') as f:
+            f.write('FB:facebook\nGE:general electric\n')
+        db = 'sqlite:///' + os.path.join(self.dir, 'companyData.db')
+        config = load_config(services=['api', 'receiver'], api=('127.0.0.1', 11311), receiver=('127.0.0.1', 11313),
+                             data=self.dir, db=db, replay=True, replay_start='2017-11-01', replay_speed=0.)
+        stop = asyncio.Event()
+        replay = mock.MagicMock(side_effect=lambda *_: stop.set() or asyncio.sleep(0))
+        launched = datetime.now()
+        with mock.patch.object(Receiver, 'replay', replay):
+            await asyncio.wait_for(serve(config, stop), 10)
+        reader, speed = replay.call_args[0]
+        assert reader.start == datetime(2017, 11, 1), 'Replay start not configured'
+        assert launched <= reader.end <= datetime.now(), 'Replay end did not default to launch time'
+        assert speed == 0., 'Replay speed not configured'
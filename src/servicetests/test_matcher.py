@@ -0,0 +1,37 @@
+import unittest
+
+from services.matcher import TopicMatcher
+
+
+class TestTopicMatcher(unittest.TestCase):
+    """Test case for testing reverse indexing and matching of TopicMatcher automaton"""
+    def setUp(self):
+        self.topics = {'FB': ['facebook', 'mark zuckerberg', 'whatsapp', 'facebook'],
+                       'GE': ['general electric', 'ge', 'ge aviation'],
+                       'DISCA': ['discoverydocs', 'discovery', 'discoverydocs'],
+                       'DISCK': ['discovery']}
+        self.matcher = TopicMatcher(self.topics)
+
+    def test_reverse_index(self):
+        """Tests whether phrases map back to the correct tickers with duplicates collapsed"""
+        assert self.matcher['facebook'] == {'FB'}, 'Phrase not mapped to correct ticker'
+        assert self.matcher['Discovery'] == {'DISCA', 'DISCK'}, 'Shared phrase not mapped to all tickers'
+        assert len(self.matcher) == 8, 'Duplicate phrases were not collapsed, {}'.format(len(self.matcher))
+
+    def test_match_whole_words(self):
+        """Tests whether phrases are only matched on word boundaries"""
+        assert self.matcher.match('Mark Zuckerberg bought WhatsApp') == {'FB'}, 'Did not match phrases'
+        assert self.matcher.match('GE aviation is part of general electric') == {'GE'}, 'Did not match phrases'
+        assert self.matcher.match('a gentle ending at the gear shop') == set(), 'Matched phrase inside a word'
+        assert self.matcher.match('') == set(), 'Matched tickers in empty text'
+
+    def test_match_overlapping_phrases(self):
+        """Tests whether overlapping and nested phrases are all found"""
+        found = {self.matcher.phrases[pid] for _, _, pid in self.matcher.find('new ge aviation engine')}
+        assert found == {'ge', 'ge aviation'}, 'Nested phrases not all found, {}'.format(found)
+        assert self.matcher.match('facebook, discoverydocs') == {'FB', 'DISCA'}, 'Did not match adjacent phrases'
+
+    def test_classify(self):
+        """Tests whether a batch of texts is classified into sorted ticker hits"""
+        result = self.matcher.classify(['discovery channel', 'nothing here', 'facebook and ge'])
+        assert result == [['DISCA', 'DISCK'], [], ['FB', 'GE']], 'Incorrect classification, {}'.format(result)
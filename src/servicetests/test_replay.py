@@ -0,0 +1,115 @@
+import asyncio
+import os
+import queue
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from multiprocessing.connection import Client
+from threading import Thread
+
+from sqlalchemy import create_engine
+
+from services.receiver import Receiver
+from services.receiver_extensions import QueueDBWriter
+from services.replay import FrameReader, Replayer
+from servicetests import synchronous
+
+
+class TestReplay(unittest.TestCase):
+    """Test case for testing reading and replaying of frames stored by QueueDBWriter"""
+    companies = ['AAPL', 'FB', 'GE']
+    types = ['article', 'blog', 'reddit', 'twitter', 'stock']
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = 'sqlite:///' + os.path.join(self.dir, 'companyData.db')
+        writer = QueueDBWriter(None, self.companies, self.db)
+        self.times = [datetime(2017, 11, 1) + timedelta(milliseconds=10 * i) for i in range(50)]
+        for i, t in enumerate(self.times):
+            writer.update_database({k: {c: float(i) for c in self.companies} for k in self.types}, t)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_all_frames(self):
+        """Tests whether all frames are read in time order across several chunks"""
+        frames = list(FrameReader(self.db, chunk_size=7))
+        assert [t for t, _ in frames] == self.times, 'Frames not read in time order'
+        assert frames[3][1] == {k: {c: 3. for c in self.companies} for k in self.types}, \
+            'Frame not in the form posted to the receiver, {}'.format(frames[3][1])
+
+    def test_read_time_range(self):
+        """Tests whether only frames within the time range are read"""
+        frames = list(FrameReader(self.db, start=self.times[10], end=self.times[29], chunk_size=4))
+        assert [t for t, _ in frames] == self.times[10:30], 'Incorrect frames read for time range'
+
+    @synchronous
+    async def test_replay_max_speed(self):
+        """Tests whether replay at max speed fans out every frame to every queue"""
+        queues = [asyncio.Queue(), asyncio.Queue()]
+        replayer = Replayer(queues, FrameReader(self.db, chunk_size=16), speed=None)
+        assert await replayer.run() == 50, 'Not all frames were replayed'
+        assert all(q.qsize() == 50 for q in queues), 'Frames not fanned out to all queues'
+        assert replayer.frames_per_second > 0, 'Throughput not measured'
+
+    @synchronous
+    async def test_replay_scaled_speed(self):
+        """Tests whether scaled replay is paced by the stored frame times"""
+        replayer = Replayer([asyncio.Queue()], FrameReader(self.db), speed=2.)
+        start = time.perf_counter()
+        await replayer.run()
+        elapsed = time.perf_counter() - start
+        # 490ms of stored data at double speed
+        assert 0.2 < elapsed < 1., 'Replay not paced correctly, took {:.3f}s'.format(elapsed)
+
+    @synchronous
+    async def test_replay_latest_queues_bounded(self):
+        """Tests whether latest queues only ever hold the newest frames"""
+        latest = asyncio.Queue()
+        replayer = Replayer([], FrameReader(self.db), speed=None, latest=[latest], keep=3)
+        await replayer.run()
+        frames = [latest.get_nowait() for _ in range(latest.qsize())]
+        assert [f['stock']['FB'] for f in frames] == [47., 48., 49.], 'Latest queue did not keep newest frames'
+
+    @synchronous
+    async def test_replay_backpressure(self):
+        """Tests whether a bounded queue with a slow consumer receives every frame in order"""
+        q, received = queue.Queue(maxsize=2), []
+
+        def consume():
+            for _ in range(50):
+                received.append(q.get()['stock']['FB'])
+                time.sleep(0.001)
+        consumer = Thread(target=consume)
+        consumer.start()
+        await Replayer([q], FrameReader(self.db), speed=None).run()
+        consumer.join(5)
+        assert received == [float(i) for i in range(50)], 'Frames lost or reordered under backpressure'
+
+    @synchronous
+    async def test_receiver_replay(self):
+        """Tests whether receiver replay delivers every frame to a connected gym at max speed,
+        while other consumers' queues stay bounded and nothing is sent to the database writer"""
+        receiver = Receiver(self.companies, db=self.db)
+        received = []
+
+        def consume():
+            with Client(receiver.gym.address, authkey=b'veryscrape') as conn:
+                for _ in range(50):
+                    received.append(conn.recv()['stock']['FB'])
+        consumer = Thread(target=consume)
+        consumer.start()
+        try:
+            replayer = await receiver.replay(FrameReader(self.db, chunk_size=8), speed=None)
+            await asyncio.get_event_loop().run_in_executor(None, consumer.join, 5)
+            assert replayer.n_frames == 50, 'Not all frames were replayed'
+            assert received == [float(i) for i in range(50)], 'Gym did not receive every replayed frame in order'
+            assert receiver.queues[0].empty(), 'Replayed frames were sent to the database writer'
+            assert all(0 < q.qsize() <= receiver.gym.max_items_in_queue for q in receiver.queues[2:]), \
+                'Consumer queues not bounded during replay'
+        finally:
+            await receiver.stop()
+        count = create_engine(self.db).execute('select count(*) from stock').scalar()
+        assert count == 50, 'Replayed frames were written back to the database'